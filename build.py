@@ -2,7 +2,8 @@
 
 import argparse
 import os
-from nexusutils.nexusbuilder import NexusBuilder
+import h5py
+from nexusutils.nexusbuilder import NexusBuilder, BLOSC_FILTER_ID
 from nexusutils.nexustooff import nexus_geometry_to_off_file
 
 if __name__ == "__main__":
@@ -43,8 +44,9 @@ if __name__ == "__main__":
     optional_args.add_argument(
         "-c",
         "--compress-type",
-        default="gzip",
-        help="Specify compression type for NeXus file (gzip, szip, none, ...)",
+        default=None,
+        help="Specify compression type for NeXus file (gzip, szip, blosc_lz4, blosc_zstd, blosc_lz4_bitshuffle, none, ...), "
+        "defaults to blosc_lz4 if the Blosc filter is available, otherwise gzip",
     )
 
     arguments = parser.parse_args()
@@ -64,6 +66,10 @@ if __name__ == "__main__":
     )
     nexus_file_fullpath = os.path.join(output_dir, output_filename)
 
+    if arguments.compress_type is None:
+        arguments.compress_type = (
+            "blosc_lz4" if h5py.h5z.filter_avail(BLOSC_FILTER_ID) else "gzip"
+        )
     compress_options = None
     if arguments.compress_type == "gzip":
         compress_options = 1
@@ -1,11 +1,11 @@
 import h5py
 import random
 import numpy as np
-from nexusutils.utils import create_dataset
+from nexusutils.utils import create_dataset, create_string_attribute
 
 
 def generate_fake_events(
-    nexus_entry: h5py._hl.group.Group,
+    nexus_entry: h5py.Group,
     events_per_pulse,
     number_of_pulses,
     pulse_freq_hz=10.0,
@@ -36,9 +36,7 @@ def generate_fake_events(
                 high=tof_max_ns,
             )
             event_group = detector.create_group("event_data")
-            event_group.attrs.create(
-                "NX_class", np.array("NXevent_data").astype("|S12")
-            )
+            create_string_attribute(event_group, "NX_class", "NXevent_data")
             create_dataset(
                 nexus_entry,
                 event_group,
@@ -30,6 +30,8 @@ class IDFParser:
         self.root = xml.etree.ElementTree.parse(idf_file).getroot()
         self.ns = {"d": "http://www.mantidproject.org/IDF/1.0"}
         self.__get_defaults()
+        # Vertices of each StructuredDetector type, many detector panels can share a type
+        self._structured_detector_vertices = {}
         # Our root should be the instrument
         assert self.root.tag == "{" + self.ns["d"] + "}instrument"
 
@@ -886,8 +888,10 @@ class IDFParser:
         Looks for type definition for a StructuredDetector with the specified name and returns an array of vertices
 
         :param type_name: The name of a StructuredDetector type definition
-        :return: Numpy array of vertex coordinates
+        :return: Numpy array of vertex coordinates, it is shared between calls so it is read-only
         """
+        if type_name in self._structured_detector_vertices:
+            return self._structured_detector_vertices[type_name]
         for xml_type in self.root.findall("d:type", self.ns):
             if xml_type.get("name") == type_name:
                 x_pixels = int(xml_type.get("xpixels"))
@@ -904,6 +908,8 @@ class IDFParser:
                         # We've filled a row, move to the next one
                         vertex_number_x = 0
                         vertex_number_y += 1
+                vertices.setflags(write=False)
+                self._structured_detector_vertices[type_name] = vertices
                 return vertices
         return None
 
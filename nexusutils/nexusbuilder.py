@@ -1,30 +1,85 @@
 import h5py
 import logging
-from collections import OrderedDict
+import os
 import numpy as np
+from collections import Counter
 from nexusutils.idfparser import IDFParser
 from nexusutils.utils import (
+    is_close,
     is_scalar,
     normalise,
     get_an_orthogonal_unit_vector,
     create_dataset,
+    calculate_chunk_shape,
+    iter_blocks,
+    create_string_attribute,
+    is_shuffled_type,
 )
 from nexusutils.readwriteoff import create_off_face_vertex_map, parse_off_file
 from nexusutils.generatefakeevents import generate_fake_events
 
+try:
+    # Registers the Blosc compression filter with HDF5
+    import hdf5plugin  # noqa: F401
+except ImportError:
+    try:
+        # PyTables registers the Blosc filter when it is imported, this only helps h5py if both use the same
+        # HDF5 library, which is not the case for the PyTables wheels as they bundle their own
+        import tables  # noqa: F401
+    except ImportError:
+        pass
+
 logger = logging.getLogger("NeXus_Utils")
-logger.setLevel(logging.INFO)
+# Set NEXUS_BUILDER_DEBUG=1 in the environment to get debug output
+logger.setLevel(
+    logging.DEBUG if os.environ.get("NEXUS_BUILDER_DEBUG") == "1" else logging.INFO
+)
 console = logging.StreamHandler()
 formatter = logging.Formatter("%(name)-12s: %(levelname)-8s %(message)s")
 console.setFormatter(formatter)
 logger.addHandler(console)
+# The console handler above already outputs messages, don't repeat them via handlers of the root logger
+logger.propagate = False
+
+BLOSC_FILTER_ID = 32001
+# Blosc filter options are (reserved, reserved, typesize, chunk size, compression level, shuffle, compressor),
+# typesize and chunk size are filled in by the filter itself
+COMPRESSION_PRESETS = {
+    "blosc_lz4": (BLOSC_FILTER_ID, (0, 0, 0, 0, 5, 1, 1)),
+    "blosc_zstd": (BLOSC_FILTER_ID, (0, 0, 0, 0, 5, 1, 5)),
+    "blosc_lz4_bitshuffle": (BLOSC_FILTER_ID, (0, 0, 0, 0, 5, 2, 1)),
+}
+# HDF5 filter ids for the compression filters h5py refers to by name
+COMPRESSION_FILTER_IDS = {
+    "gzip": h5py.h5z.FILTER_DEFLATE,
+    "lzf": h5py.h5z.FILTER_LZF,
+    "szip": h5py.h5z.FILTER_SZIP,
+}
+# Filters which do not change how the data are compressed
+NON_COMPRESSION_FILTER_IDS = (h5py.h5z.FILTER_SHUFFLE, h5py.h5z.FILTER_FLETCHER32)
+
+# Compressed arrays are split into chunks of roughly this many bytes (before compression)
+COMPRESSED_CHUNK_BYTES = 1024 * 1024
+# Smaller arrays are not compressed, the filter and chunk index overheads outweigh the few bytes saved
+MIN_COMPRESSED_BYTES = 64 * 1024
+# Datasets are copied in blocks of roughly this many bytes to bound memory use
+COPY_BLOCK_BYTES = 16 * 1024 * 1024
+# The chunk cache of each open dataset must hold all the chunks of a copied block, otherwise partially
+# written chunks are evicted and must be read back, so rdcc_nbytes must be at least COPY_BLOCK_BYTES.
+# rdcc_nslots should be a prime number around 100 times the number of chunks which fit in the cache.
+CHUNK_CACHE_OPTIONS = {"rdcc_nbytes": 4 * COPY_BLOCK_BYTES, "rdcc_nslots": 100003}
+
+PIXEL_OFFSET_NAMES = ("x_pixel_offset", "y_pixel_offset", "z_pixel_offset")
+
+TRANSFORMATION_TYPES = ("translation", "rotation")
 
 
 class NexusBuilder:
     """
     Assists with building example NeXus files in prototype ESS format from existing files from other institutions
 
-    NB. tables import looks redundant but actually loads BLOSC compression filter
+    NB. the Blosc compression filter is only available if hdf5plugin is installed, or if PyTables is built
+    against the same HDF5 library as h5py
     """
 
     def __init__(
@@ -36,66 +91,169 @@ class NexusBuilder:
         nx_entry_name="raw_data_1",
         idf_file=None,
         file_in_memory=False,
+        libver="latest",
     ):
         """
-        compress_type=32001 for BLOSC
+        compress_type=32001 for BLOSC, or use one of the COMPRESSION_PRESETS ("blosc_lz4", "blosc_zstd",
+        "blosc_lz4_bitshuffle") which are much faster to write than gzip. The presets use Blosc's byte or bit
+        shuffle, the element size it shuffles by is taken from the dataset type by the filter itself. Files are
+        written uncompressed by default because Blosc compressed files can only be read where the Blosc filter
+        plugin is installed, which is not the case for HDFView and many other HDF5 applications.
 
         :param output_nexus_filename: Name of the output file
         :param input_nexus_filename: Name of the input file
         :param nx_entry_name: Name of the root group (NXentry class)
         :param compress_type: Name or id of compression filter https://support.hdfgroup.org/services/contributions.html
-        :param compress_opts: Compression options, for example gzip compression level
+                              or name of a compression preset
+        :param compress_opts: Compression options, for example gzip compression level, overrides preset options
         :param idf_file: File name or object for a Mantid IDF file from which to get instrument geometry
         :param file_in_memory: If true the NeXus file is built in memory and never written to disk (for testing)
+        :param libver: HDF5 file format version bounds for the output file, the latest format has more compact
+                       object headers and group indexes but needs HDF5 1.10 or newer to read it, use "earliest"
+                       for files which must be readable by older software
         """
+        if compress_type in COMPRESSION_PRESETS:
+            compress_type, preset_opts = COMPRESSION_PRESETS[compress_type]
+            if compress_opts is None:
+                compress_opts = preset_opts
+        if compress_type == BLOSC_FILTER_ID and not h5py.h5z.filter_avail(
+            BLOSC_FILTER_ID
+        ):
+            raise ValueError(
+                "The Blosc HDF5 filter is not available, install hdf5plugin to use it"
+            )
         self.compress_type = compress_type
         self.compress_opts = compress_opts
-        if input_nexus_filename:
-            self.source_file = h5py.File(input_nexus_filename, "r")
-        else:
-            self.source_file = None
+        # Blosc shuffles bytes itself, the HDF5 shuffle filter helps the other compression filters
+        self.shuffle = compress_type not in (None, BLOSC_FILTER_ID)
+        # The input file and IDF are only opened and parsed when they are first used
+        self._input_nexus_filename = input_nexus_filename
+        self._source_file = None
+        target_file_options = dict(libver=libver, **CHUNK_CACHE_OPTIONS)
         if file_in_memory:
-            self.target_file = h5py.File(
-                output_nexus_filename, "w", driver="core", backing_store=False
-            )
-        else:
-            self.target_file = h5py.File(output_nexus_filename, "w")
+            target_file_options.update(driver="core", backing_store=False)
+        self.target_file = h5py.File(output_nexus_filename, "w", **target_file_options)
         # Having an NXentry root group is compulsory in NeXus format
         self.root = self.__add_nx_entry(nx_entry_name)
-        if idf_file:
-            self.idf_parser = IDFParser(idf_file)
-            self.length_units = self.idf_parser.get_length_units()
-        else:
-            self.idf_parser = None
-            self.length_units = "m"
+        self._idf_file = idf_file
+        self._idf_parser = None
+        if idf_file and not isinstance(idf_file, (str, os.PathLike)):
+            # The caller may close a file object after construction, so parse it now
+            self._idf_parser = IDFParser(idf_file)
+        self._length_units = None
         self.instrument = None
         self.features = set()
+        # Groups looked up by their path from the NXentry
+        self._groups = {}
 
     def __enter__(self):
         return self
 
+    @property
+    def source_file(self):
+        """
+        The input NeXus file, or None if no input file was given
+        """
+        if self._source_file is None and self._input_nexus_filename:
+            self._source_file = h5py.File(
+                self._input_nexus_filename, "r", **CHUNK_CACHE_OPTIONS
+            )
+        return self._source_file
+
+    @property
+    def idf_parser(self):
+        """
+        Parser for the Mantid IDF file, or None if no IDF file was given
+        """
+        if self._idf_parser is None and self._idf_file:
+            self._idf_parser = IDFParser(self._idf_file)
+        return self._idf_parser
+
+    @property
+    def length_units(self):
+        """
+        Units used for lengths, from the IDF file if one was given, otherwise metres
+        """
+        if self._length_units is None:
+            if self.idf_parser is None:
+                self._length_units = "m"
+            else:
+                self._length_units = self.idf_parser.get_length_units()
+        return self._length_units
+
+    @length_units.setter
+    def length_units(self, units):
+        self._length_units = units
+
     def get_root(self):
         return self.root
 
     def copy_items(self, dataset_map):
         """
         Copy datasets and groups from one NeXus file to another
-        NB, the order is important as the method of copying groups used deletes any sub-groups and datasets.
+        Items are copied in order of depth in the output file, so that each group is created before its members
+        are copied into it, and members of the same group are copied one after another.
 
-        :param dataset_map: Input groups and datasets to output ones, order must be top-down in hierarchy of output file
-                            Must be ordered.
+        :param dataset_map: Mapping of input groups and datasets to output ones, in any order
         """
-        if not isinstance(dataset_map, OrderedDict):
-            raise Exception(
-                "Map of source and target items must be an OrderedDict in top-down hierarchy order of the target file"
-            )
-
-        for source_item_name, target_item_name in dataset_map.items():
+        copy_order = sorted(
+            dataset_map.items(),
+            key=lambda item: (item[1].strip("/").count("/"), os.path.dirname(item[1])),
+        )
+        for source_item_name, target_item_name in copy_order:
             source_item = self.source_file.get(source_item_name)
             if isinstance(source_item, h5py.Dataset):
                 self.__copy_dataset(source_item, target_item_name)
             elif isinstance(source_item, h5py.Group):
-                self.__copy_group(source_item_name, target_item_name)
+                self.__copy_group(source_item, target_item_name)
+
+    def copy_tree(self, source_item_name, target_item_name):
+        """
+        Copy a group with all of its members, or a single dataset, from one NeXus file to another
+
+        If every dataset in the group is already stored with the builder's compression settings then the whole
+        tree is copied by HDF5 in a single object copy (H5Ocopy), otherwise each member is copied in turn so
+        that datasets can be re-compressed. Soft links are only preserved by the single object copy.
+
+        :param source_item_name: Name of the group or dataset in the source file
+        :param target_item_name: Name for the copy in the target file
+        """
+        source_item = self.source_file.get(source_item_name)
+        if isinstance(source_item, h5py.Dataset):
+            self.__copy_dataset(source_item, target_item_name)
+            return
+
+        members = []
+        source_item.visititems(lambda name, item: members.append((name, item)))
+        datasets = [item for _, item in members if isinstance(item, h5py.Dataset)]
+        if all(self.__has_target_compression(dataset) for dataset in datasets):
+            self.target_file.copy(source_item, target_item_name)
+            target_group = self.target_file[target_item_name]
+            for name, item in members:
+                if isinstance(item, h5py.Dataset) and "target" in item.attrs:
+                    del target_group[name].attrs["target"]
+            return
+
+        self.__copy_group(source_item, target_item_name)
+        for name, item in members:
+            if isinstance(item, h5py.Dataset):
+                self.__copy_dataset(item, target_item_name + "/" + name)
+            else:
+                self.__copy_group(item, target_item_name + "/" + name)
+
+    def __get_group(self, group):
+        """
+        Look up a group in the output file, each path is only resolved by HDF5 the first time it is used
+
+        :param group: Group object, or group path from NXentry as a string
+        :return: Group object
+        """
+        if not isinstance(group, str):
+            return group
+        group_object = self._groups.get(group)
+        if group_object is None:
+            group_object = self._groups[group] = self.root[group]
+        return group_object
 
     def add_user(self, name, affiliation, number=1):
         """
@@ -111,7 +269,7 @@ class NexusBuilder:
         self.add_dataset(user_group, "affiliation", affiliation)
         return user_group
 
-    def add_dataset(self, group, name, data, attributes=None):
+    def add_dataset(self, group, name, data, attributes=None, chunks=None):
         """
         Add a dataset to a given group
 
@@ -119,16 +277,35 @@ class NexusBuilder:
         :param name: Name of the dataset to create
         :param data: Data to put in the dataset
         :param attributes: Optional dictionary of attributes to add to dataset
+        :param chunks: Optional chunk shape for the dataset, by default compressed arrays are split into chunks
+                       of about COMPRESSED_CHUNK_BYTES along their first dimension only, so that each chunk
+                       holds whole rows, arrays smaller than MIN_COMPRESSED_BYTES are not compressed
         :return: Dataset
         """
+        if isinstance(data, (list, tuple)):
+            array_data = np.asarray(data)
+            # Lists of strings are left for h5py to write as variable-length strings
+            if array_data.dtype.kind not in "UO":
+                data = array_data
+        compress_type, compress_opts, shuffle = (
+            self.compress_type,
+            self.compress_opts,
+            self.shuffle,
+        )
+        if isinstance(data, np.ndarray) and data.nbytes < MIN_COMPRESSED_BYTES:
+            compress_type, compress_opts, shuffle = None, None, False
+        elif chunks is None and isinstance(data, np.ndarray) and data.ndim > 0:
+            chunks = self.__get_compressed_chunk_shape(data)
         return create_dataset(
             self.root,
-            group,
+            self.__get_group(group),
             name,
             data,
             attributes,
-            self.compress_type,
-            self.compress_opts,
+            compress_type,
+            compress_opts,
+            chunks,
+            shuffle,
         )
 
     def add_detectors_from_idf(self):
@@ -144,43 +321,30 @@ class NexusBuilder:
         total_panels = 0
         detectors = self.idf_parser.get_detectors()
         detectors += list(self.idf_parser.get_rectangular_detectors())
-        written_types = []  # {'types': [str], 'group': hdf5group}
+        # Detector group written for each tuple of sub component types
+        written_types = {}
         if detectors is not None:
             for detector in detectors:
                 total_panels += 1
-                new_detector_type = True
                 pixel_shape_group = None
-                if detector["sub_components"] in [
-                    written_type["types"] for written_type in written_types
-                ]:
-                    new_detector_type = False
-                    written_group = next(
-                        (
-                            written_type["group"]
-                            for written_type in written_types
-                            if written_type["types"] == detector["sub_components"]
-                        ),
-                        None,
-                    )
-                    try:
-                        z_offset_dataset = written_group["z_pixel_offset"]
-                    except KeyError:
-                        z_offset_dataset = None
+                detector_type = tuple(detector["sub_components"])
+                written_group = written_types.get(detector_type)
+                new_detector_type = written_group is None
+                if not new_detector_type:
+                    # z offsets are not written if they are all zero
                     pixel_offsets = {
-                        "x_pixel_offset": written_group["x_pixel_offset"],
-                        "y_pixel_offset": written_group["y_pixel_offset"],
-                        "z_pixel_offset": z_offset_dataset,
+                        offset_name: written_group.get(offset_name)
+                        for offset_name in PIXEL_OFFSET_NAMES
                     }
-                    if "pixel_shape" in list(written_group.keys()):
+                    if "pixel_shape" in written_group:
                         pixel_shape_group = written_group["pixel_shape"]
                 else:
                     offsets = np.array(detector["offsets"])
                     pixel_offsets = {
-                        "x_pixel_offset": offsets[..., 0],
-                        "y_pixel_offset": offsets[..., 1],
-                        "z_pixel_offset": offsets[..., 2],
+                        offset_name: offsets[..., axis]
+                        for axis, offset_name in enumerate(PIXEL_OFFSET_NAMES)
                     }
-                    if np.count_nonzero(pixel_offsets["z_pixel_offset"]) == 0:
+                    if not np.any(pixel_offsets["z_pixel_offset"]):
                         pixel_offsets["z_pixel_offset"] = None
 
                 pixel_shape = detector["pixel"]["shape"]
@@ -207,9 +371,7 @@ class NexusBuilder:
                 )
 
                 if new_detector_type:
-                    written_types.append(
-                        {"types": detector["sub_components"], "group": detector_group}
-                    )
+                    written_types[detector_type] = detector_group
 
         return total_panels
 
@@ -285,15 +447,15 @@ class NexusBuilder:
         :return: Number of monitors added
         """
         if self.instrument is None:
-            raise Exception(
+            raise RuntimeError(
                 "There needs to be an NXinstrument before you can add monitors"
             )
 
         monitors, monitor_types = self.idf_parser.get_monitors()
         monitor_names = [monitor["name"] for monitor in monitors]
-        repeated_names = set(
-            [name for name in monitor_names if monitor_names.count(name) > 1]
-        )
+        repeated_names = {
+            name for name, count in Counter(monitor_names).items() if count > 1
+        }
         for monitor in monitors:
             name = monitor["name"]
             # If multiple monitors have the same name then append the id to the name
@@ -351,6 +513,8 @@ class NexusBuilder:
                 if isinstance(offset_dataset, h5py.Dataset):
                     detector_group[dataset_name] = offset_dataset
                 else:
+                    # Single precision, the same as the vertices of pixel shapes
+                    offset_dataset = np.asarray(offset_dataset, dtype=np.float32)
                     self.add_dataset(
                         detector_group,
                         dataset_name,
@@ -360,10 +524,20 @@ class NexusBuilder:
         self.add_dataset(
             detector_group,
             "detector_number",
-            np.array(detector_ids).astype(np.dtype("int32")),
+            np.asarray(detector_ids, dtype=np.int32),
         )
         return detector_group
 
+    def __get_compressed_chunk_shape(self, data):
+        """
+        Chunk shape for a large array, or None to let h5py decide if the array is scalar or is not compressed
+        """
+        if self.compress_type is None or data.ndim == 0 or data.size == 1:
+            return None
+        return calculate_chunk_shape(
+            data.shape, data.dtype.itemsize, COMPRESSED_CHUNK_BYTES
+        )
+
     def __add_distance_datasets(self, group, scalar_params):
         for name, data in scalar_params.items():
             if data is not None:
@@ -374,7 +548,7 @@ class NexusBuilder:
         for parameter_name in parameters:
             parameter = parameters[parameter_name]
             if parameter is not None and not is_scalar(parameter):
-                raise Exception(
+                raise ValueError(
                     "In NexusBuilder.add_detector_bank "
                     + parameter_name
                     + " must be scalar"
@@ -390,7 +564,7 @@ class NexusBuilder:
         :return: NXdetector group
         """
         if self.instrument is None:
-            raise Exception(
+            raise RuntimeError(
                 "There needs to be an NXinstrument before you can add detectors"
             )
         detector_group = self.add_nx_group(
@@ -412,24 +586,22 @@ class NexusBuilder:
         :param detector_faces: Optional array or list of face number-detector id pairs
         :return: NXoff_geometry group
         """
-        if isinstance(group, str):
-            group = self.root[group]
-
+        group = self.__get_group(group)
         winding_order, faces = create_off_face_vertex_map(off_faces)
         shape = self.add_nx_group(group, name, "NXoff_geometry")
         self.add_dataset(
             shape,
             "vertices",
-            np.array(vertices).astype("float32"),
+            np.asarray(vertices, dtype=np.float32),
             {"units": self.length_units},
         )
         self.add_dataset(
-            shape, "winding_order", np.array(winding_order).astype("int32")
+            shape, "winding_order", np.asarray(winding_order, dtype=np.int32)
         )
-        self.add_dataset(shape, "faces", np.array(faces).astype("int32"))
+        self.add_dataset(shape, "faces", np.asarray(faces, dtype=np.int32))
         if detector_faces is not None:
             self.add_dataset(
-                shape, "detector_faces", np.array(detector_faces).astype("int32")
+                shape, "detector_faces", np.asarray(detector_faces, dtype=np.int32)
             )
         return shape
 
@@ -445,7 +617,7 @@ class NexusBuilder:
         :return: NXcylindrical_geometry describing a single pixel
         """
         axis_unit, axis_mag = normalise(axis)
-        if not np.isclose([axis_mag], [1.0]):
+        if not is_close(axis_mag, 1.0, rel_tol=1e-05, abs_tol=1e-08):
             axis = axis_unit
             logger.warning(
                 "Axis vector given to NexusBuilder.add_tube_pixel was not a unit vector. "
@@ -458,79 +630,156 @@ class NexusBuilder:
         vector_b = (
             radius * get_an_orthogonal_unit_vector(vector_a - vector_c)
         ) + vector_a
-        vertices = np.array([vector_a, vector_b, vector_c]).astype(float)
+        vertices = np.array([vector_a, vector_b, vector_c], dtype=float)
         shape = self.add_nx_group(group, "pixel_shape", "NXcylindrical_geometry")
         self.add_dataset(shape, "vertices", vertices, {"units": self.length_units})
-        self.add_dataset(shape, "cylinders", np.array([[0, 1, 2]]).astype("int32"))
+        self.add_dataset(shape, "cylinders", np.array([[0, 1, 2]], dtype=np.int32))
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.__add_features()
-        if self.source_file is not None:
-            self.source_file.close()
+        self.close()
+
+    def close(self):
+        """
+        Record the NeXus features used and close the input and output files, closing again does nothing
+        Use the NexusBuilder as a context manager to have it closed automatically
+        """
+        if self._source_file is not None:
+            self._source_file.close()
+            self._source_file = None
+        # Stop the input file being opened again on first use
+        self._input_nexus_filename = None
         if self.target_file is not None:
+            self.__add_features()
             self.target_file.close()
+            self.target_file = None
 
     def __add_nx_entry(self, nx_entry_name):
         entry_group = self.target_file.create_group(nx_entry_name)
-        entry_group.attrs.create("NX_class", np.array("NXentry").astype("|S7"))
+        create_string_attribute(entry_group, "NX_class", "NXentry")
         return entry_group
 
-    def __copy_group(self, source_group_name, target_group_name):
+    def __copy_group(self, source_group, target_group_name):
         """
         Copy a group with its attributes but without members
 
-        :param source_group_name: Name of group in source file
+        :param source_group: Group in source file
         :param target_group_name: Name of group in target file
         """
-        self.target_file.copy(
-            self.source_file[source_group_name], target_group_name, shallow=True
+        target_group = self.target_file.create_group(target_group_name)
+        target_group.attrs.update(source_group.attrs)
+
+    def __has_target_compression(self, dataset):
+        """
+        :param dataset: A dataset in the source file
+        :return: True if the dataset is stored with the compression settings used for the target file
+        """
+        # Read the filter pipeline itself, h5py's dataset.compression is None for plugin filters such as Blosc
+        create_plist = dataset.id.get_create_plist()
+        source_filters = {}
+        for filter_index in range(create_plist.get_nfilters()):
+            filter_id, _, filter_opts, _ = create_plist.get_filter(filter_index)
+            if filter_id not in NON_COMPRESSION_FILTER_IDS:
+                source_filters[filter_id] = filter_opts
+        if self.compress_type is None:
+            return not source_filters
+        filter_id = COMPRESSION_FILTER_IDS.get(self.compress_type, self.compress_type)
+        if list(source_filters) != [filter_id]:
+            return False
+        if self.compress_opts is None:
+            return True
+        source_opts = source_filters[filter_id]
+        target_opts = tuple(np.atleast_1d(self.compress_opts))
+        if filter_id == BLOSC_FILTER_ID:
+            # The first four Blosc options are filled in by the filter itself
+            return source_opts[4:] == target_opts[4:]
+        return source_opts == target_opts
+
+    @staticmethod
+    def __get_copy_block_shape(dataset):
+        """
+        :param dataset: A dataset in the source file
+        :return: Shape of the blocks to copy the dataset in, aligned with its chunks if it is chunked
+        """
+        block_shape = calculate_chunk_shape(
+            dataset.shape, dataset.dtype.itemsize, COPY_BLOCK_BYTES
         )
-        for sub_group in self.source_file[source_group_name].keys():
-            if sub_group in self.target_file[target_group_name]:
-                self.target_file[target_group_name].__delitem__(sub_group)
+        if dataset.chunks is None:
+            return block_shape
+        # Copy whole chunks so that each one is only decompressed once
+        rows_per_block = max(1, block_shape[0] // dataset.chunks[0])
+        return (rows_per_block * dataset.chunks[0],) + dataset.chunks[1:]
 
     def __copy_dataset(self, dataset, target_dataset):
         """
         Copy a dataset with specified compression options and the source dataset's attributes
 
+        If the source dataset is already stored with the requested compression then HDF5 copies the
+        object directly (H5Ocopy), data and attributes together, without a round trip through Python.
+        The compressed chunks are copied as they are, they are not decompressed and compressed again.
+        Otherwise the data are copied in blocks through a single buffer so that large datasets are never held
+        in memory at once.
+
         :param dataset: The dataset being copied
         :param target_dataset: Name of the dataset in the target file
         """
+        if self.__has_target_compression(dataset):
+            self.target_file.copy(dataset, target_dataset)
+            copied_attributes = self.target_file[target_dataset].attrs
+            if "target" in copied_attributes:
+                del copied_attributes["target"]
+            return
         try:
-            d_set = self.target_file.create_dataset(
-                target_dataset,
-                dataset[...].shape,
-                dtype=dataset.dtype,
-                compression=self.compress_type,
-                compression_opts=self.compress_opts,
-            )
-            d_set[...] = dataset[...]
-        except TypeError:
-            logger.error(
-                "Type error copying to dataset: "
-                + target_dataset
-                + ", value is type: "
-                + str(dataset.dtype)
-            )
-        except IOError as e:
+            if not dataset.shape:
+                # Scalar datasets cannot be chunked or compressed
+                self.target_file.create_dataset(
+                    target_dataset, data=dataset[()], dtype=dataset.dtype
+                )
+            else:
+                d_set = self.target_file.create_dataset(
+                    target_dataset,
+                    dataset.shape,
+                    dtype=dataset.dtype,
+                    chunks=dataset.chunks,
+                    compression=self.compress_type,
+                    compression_opts=self.compress_opts,
+                    shuffle=self.shuffle and is_shuffled_type(dataset.dtype),
+                )
+                # An empty dataset has no data to copy
+                if dataset.size:
+                    self.__copy_dataset_blocks(dataset, d_set)
+        except (TypeError, IOError) as e:
             logger.error(
-                "IO error copying to dataset: "
-                + target_dataset
-                + ", value is type: "
-                + str(dataset.dtype)
-                + ", errorstr: "
-                + e.strerror
+                "Error copying to dataset: %s, value is type: %s, error: %s",
+                target_dataset,
+                dataset.dtype,
+                e,
             )
-        except Exception:
-            logger.error("Unexpected error in NexusBuilder.__copy_dataset")
-            raise
-        # Now copy attributes
-        source_attributes = dataset.attrs.items()
-        target_attributes = self.target_file[target_dataset].attrs
-        for key, value in source_attributes:
-            if key != "target":
-                logger.debug("attr key: " + str(key) + " value: " + str(value))
-                target_attributes.create(key, value)
+        # Now copy attributes, most datasets have none or only a "target" attribute
+        source_attributes = {
+            key: value for key, value in dataset.attrs.items() if key != "target"
+        }
+        if not source_attributes:
+            return
+        if logger.isEnabledFor(logging.DEBUG):
+            for key, value in source_attributes.items():
+                logger.debug("attr key: %s value: %s", key, value)
+        self.target_file[target_dataset].attrs.update(source_attributes)
+
+    def __copy_dataset_blocks(self, dataset, d_set):
+        """
+        Copy the data of a dataset in blocks through a single buffer
+
+        :param dataset: The dataset being copied
+        :param d_set: The dataset in the target file, with the same shape and type
+        """
+        block_shape = self.__get_copy_block_shape(dataset)
+        buffer = np.empty(
+            tuple(map(min, block_shape, dataset.shape)), dtype=dataset.dtype
+        )
+        for block in iter_blocks(dataset.shape, block_shape):
+            buffer_block = tuple(slice(0, part.stop - part.start) for part in block)
+            dataset.read_direct(buffer, block, buffer_block)
+            d_set.write_direct(buffer, buffer_block, block)
 
     def add_shape_from_file(self, filename, group, name):
         """
@@ -594,7 +843,11 @@ class NexusBuilder:
                 quadrilaterals,
                 detector_faces,
             )
-            self.add_dataset(detector_group, "detector_number", detector_ids)
+            self.add_dataset(
+                detector_group,
+                "detector_number",
+                np.asarray(detector_ids, dtype=np.int32),
+            )
             self.add_dataset(
                 detector_group,
                 "x_pixel_offset",
@@ -627,40 +880,36 @@ class NexusBuilder:
     def __create_quadrilaterals_dataset(
         pixels_in_first_dimension, pixels_in_second_dimension, detector_ids, vertices
     ):
-        quadrilaterals = []
-        detector_faces = []
-        pixel_offsets = np.zeros(
-            (pixels_in_second_dimension, pixels_in_first_dimension, 3)
+        row_index, column_index = np.meshgrid(
+            np.arange(pixels_in_second_dimension),
+            np.arange(pixels_in_first_dimension),
+            indexing="ij",
+        )
+        first_pixel = column_index + (row_index * (pixels_in_first_dimension + 1))
+        pixel_corner_indices = np.stack(
+            (
+                first_pixel,
+                first_pixel + pixels_in_first_dimension + 1,
+                first_pixel + pixels_in_first_dimension + 2,
+                first_pixel + 1,
+            ),
+            axis=-1,
+        ).reshape((-1, 4))
+        number_of_pixels = len(pixel_corner_indices)
+        # Insert 4 at start of each face to indicate 4 vertices in the face (OFF format)
+        quadrilaterals = np.column_stack(
+            (np.full(number_of_pixels, 4), pixel_corner_indices)
+        )
+        # Faces are numbered along each row in turn, the same order as the detector ids
+        detector_faces = np.column_stack(
+            (np.arange(number_of_pixels), np.ravel(detector_ids))
+        )
+        # Each pixel centre is the mean position of its corners
+        pixel_offsets = (
+            np.mean(vertices[pixel_corner_indices], axis=1)
+            .astype(np.float32)
+            .reshape((pixels_in_second_dimension, pixels_in_first_dimension, 3))
         )
-        face_number = 0
-        for row_index in range(pixels_in_second_dimension):
-            for column_index in range(pixels_in_first_dimension):
-                first_pixel = column_index + (
-                    row_index * (pixels_in_first_dimension + 1)
-                )
-                pixel_corner_indices = np.array(
-                    [
-                        first_pixel,
-                        first_pixel + pixels_in_first_dimension + 1,
-                        first_pixel + pixels_in_first_dimension + 2,
-                        first_pixel + 1,
-                    ]
-                )
-                pixel_corner_positions = vertices[pixel_corner_indices]
-
-                if (
-                    row_index != pixels_in_second_dimension
-                    and column_index != pixels_in_first_dimension
-                ):
-                    # Insert 4 at start of each face to indicate 4 vertices in the face (OFF format)
-                    quadrilaterals.append(np.insert(pixel_corner_indices, 0, 4))
-                    detector_faces.append(
-                        [face_number, detector_ids[row_index, column_index]]
-                    )
-                    pixel_centre = np.mean(pixel_corner_positions, axis=0)
-                    pixel_offsets[row_index, column_index] = pixel_centre
-
-                face_number += 1
         return quadrilaterals, detector_faces, pixel_offsets
 
     def __add_transformations_for_structured_detector(self, detector, detector_group):
@@ -699,22 +948,12 @@ class NexusBuilder:
     def __create_detector_ids_for_structured_detector(
         pixels_in_first_dimension, pixels_in_second_dimension, detector
     ):
-        # Create the id list (detector_number dataset)
-        detector_ids = np.arange(
-            detector["id_start"],
-            pixels_in_second_dimension + detector["id_start"],
-            detector["X_id_step"],
+        # Create the id list (detector_number dataset), ids increase down each column then along the rows
+        column_ids = np.arange(0, pixels_in_second_dimension, detector["X_id_step"])
+        first_id_in_each_column = detector["id_start"] + (
+            np.arange(pixels_in_first_dimension) * pixels_in_second_dimension
         )
-        detector_ids = np.expand_dims(detector_ids, axis=1)
-        for column_number in range(1, pixels_in_first_dimension):
-            row_increment = column_number * pixels_in_second_dimension
-            new_column = np.arange(
-                detector["id_start"] + row_increment,
-                detector["id_start"] + row_increment + pixels_in_second_dimension,
-                detector["X_id_step"],
-            )
-            new_column = np.expand_dims(new_column, axis=1)
-            detector_ids = np.hstack([detector_ids, new_column])
+        detector_ids = column_ids[:, np.newaxis] + first_id_in_each_column
         return detector_ids
 
     def add_monitor(self, name, detector_id, location, units=None):
@@ -728,7 +967,7 @@ class NexusBuilder:
         :return: NXmonitor
         """
         if self.instrument is None:
-            raise Exception(
+            raise RuntimeError(
                 "There needs to be an NXinstrument before you can add monitors"
             )
         if units is None:
@@ -739,7 +978,7 @@ class NexusBuilder:
         transform_group = self.add_nx_group(
             monitor_group, "transformations", "NXtransformations"
         )
-        location_unit_vector, location_magnitude = normalise(location.astype(float))
+        location_unit_vector, location_magnitude = self.__get_translation(location)
         location = self.add_transformation(
             transform_group,
             "translation",
@@ -752,6 +991,18 @@ class NexusBuilder:
         # TODO add monitor shape definition from monitor['shape']
         return monitor_group
 
+    @staticmethod
+    def __get_translation(position):
+        """
+        :param position: Position as a 3D vector
+        :return: Unit vector and magnitude of a translation to the position, a translation to the origin is
+                 given a unit vector along z as the zero vector is not a valid transformation vector
+        """
+        position = np.asarray(position, dtype=float)
+        if not np.any(position):
+            return np.array([0.0, 0.0, 1.0]), 0.0
+        return normalise(position)
+
     def add_depends_on(self, group, dependee):
         """
         Add a "depends_on" dataset to a group
@@ -805,23 +1056,23 @@ class NexusBuilder:
         :param depends_on: Name (full path) of another transformation which must be carried out before this one
         :return: The transformation
         """
-        transform_types = ["translation", "rotation"]
-        if transformation_type not in transform_types:
-            raise Exception(
+        if transformation_type not in TRANSFORMATION_TYPES:
+            raise ValueError(
                 "Transformation must be one of these types ("
-                + " ".join(transform_types)
+                + " ".join(TRANSFORMATION_TYPES)
                 + ")"
             )
         if isinstance(depends_on, (h5py.Dataset, h5py.Group)):
             depends_on = str(depends_on.name)
+        # Single precision is plenty for a unit vector, distances and angles are kept in double precision
         attributes = {
             "units": units,
-            "vector": vector,
+            "vector": np.asarray(vector, dtype=np.float32),
             "transformation_type": transformation_type,
             "depends_on": depends_on,
         }  # terminate chain with "." if no depends_on given
         if offset is not None:
-            attributes["offset"] = offset
+            attributes["offset"] = np.asarray(offset, dtype=float)
         return self.add_dataset(transform_group, name, values, attributes)
 
     def add_instrument_geometry_from_idf(self):
@@ -831,30 +1082,30 @@ class NexusBuilder:
         instrument_name = self.idf_parser.get_instrument_name()
         self.add_instrument(instrument_name)
         logger.info(
-            "Got instrument geometry for " + instrument_name + " from IDF file, it has:"
+            "Got instrument geometry for %s from IDF file, it has:", instrument_name
         )
 
         source_name = self.idf_parser.get_source_name()
         source_position = self.idf_parser.get_source_position()
         self.add_source(source_name, position=source_position)
-        logger.info("a source called " + source_name)
+        logger.info("a source called %s", source_name)
 
         self.add_sample()
 
         number_of_monitors = self.add_monitors_from_idf()
         if number_of_monitors != 0:
-            logger.info(str(number_of_monitors) + " monitors")
+            logger.info("%s monitors", number_of_monitors)
 
         number_of_grid_detectors = self.add_structured_detectors_from_idf()
         number_of_detectors = 0
         if number_of_grid_detectors != 0:
             logger.info(
-                str(number_of_grid_detectors) + " topologically, grid detector panels"
+                "%s topologically, grid detector panels", number_of_grid_detectors
             )
         else:
             number_of_detectors = self.add_detectors_from_idf()
             if number_of_detectors != 0:
-                logger.info(str(number_of_detectors) + " detector panels")
+                logger.info("%s detector panels", number_of_detectors)
 
         detectors_added = (number_of_detectors + number_of_grid_detectors) > 0
         return detectors_added
@@ -879,7 +1130,7 @@ class NexusBuilder:
         :return: The NXsource group
         """
         if self.instrument is None:
-            raise Exception(
+            raise RuntimeError(
                 "There needs to be an NXinstrument before you can add an NXsource"
             )
         source_group = self.add_nx_group(self.instrument, group_name, "NXsource")
@@ -889,9 +1140,7 @@ class NexusBuilder:
             transform_group = self.add_nx_group(
                 source_group, "transformations", "NXtransformations"
             )
-            position_unit_vector, position_magnitude = normalise(
-                np.array(position).astype(float)
-            )
+            position_unit_vector, position_magnitude = self.__get_translation(position)
             source_position = self.add_transformation(
                 transform_group,
                 "translation",
@@ -913,13 +1162,10 @@ class NexusBuilder:
         :param nx_class_name: Name of the NXclass
         :return:
         """
-        if isinstance(parent_group, str):
-            parent_group = self.root[parent_group]
+        parent_group = self.__get_group(parent_group)
         group_name = group_name.replace(" ", "_")
         created_group = parent_group.create_group(group_name)
-        created_group.attrs.create(
-            "NX_class", np.array(nx_class_name).astype("|S" + str(len(nx_class_name)))
-        )
+        create_string_attribute(created_group, "NX_class", nx_class_name)
         self.add_feature_for_class(nx_class_name)
         return created_group
 
@@ -1,5 +1,6 @@
 import numpy as np
 import logging
+from functools import lru_cache
 from nexusutils.utils import find_rotation_matrix_between_vectors
 
 logger = logging.getLogger("NeXus_Utils")
@@ -10,12 +11,13 @@ def parse_off_file(off_file):
     Read vertex list and face definitions from an OFF file and return as lists of numpy arrays
 
     :param off_file: File object assumed to contain geometry description in OFF format
-    :return: List of vertices and list of vertex indices in each face
+    :return: List of vertices and vertex indices in each face, a 2D array if all faces have the same number of
+             vertices, otherwise a list of arrays
     """
     file_start = off_file.readline()
     if file_start != "OFF\n":
         logger.error(
-            'OFF file is expected to start "OFF", actually started: ' + file_start
+            'OFF file is expected to start "OFF", actually started: %s', file_start
         )
         return None
     line = off_file.readline()
@@ -28,25 +30,45 @@ def parse_off_file(off_file):
     # number_of_faces = int(counts[1])
     # number_of_edges = int(counts[2])
 
-    off_vertices = np.zeros((number_of_vertices, 3), dtype=float)  # preallocate
-    vertex_number = 0
-    while vertex_number < number_of_vertices:
-        line = off_file.readline()
-        if line[0] != "#" and line != "\n":
-            off_vertices[vertex_number, :] = np.array(line.split()).astype(float)
-            vertex_number += 1
+    # Comment and blank lines can appear anywhere in the rest of the file
+    data_lines = [line for line in off_file if line[0] != "#" and not line.isspace()]
+    off_vertices = np.loadtxt(
+        data_lines[:number_of_vertices], dtype=float, ndmin=2
+    ).reshape((number_of_vertices, 3))
 
-    faces_lines = off_file.readlines()
     # Only keep the first value (number of vertex indices in face) plus the number of vertices.
     # There may be other numbers following it to define a colour for the face, which we don't want to keep
-    all_faces = [
-        np.array(face_line.split()[: (int(face_line.split()[0]) + 1)]).astype(int)
-        for face_line in faces_lines
-        if face_line[0] != "#"
-    ]
+    face_lines = data_lines[number_of_vertices:]
+    all_faces = _parse_uniform_off_faces(face_lines)
+    if all_faces is not None:
+        return off_vertices, all_faces
+    all_faces = []
+    for face_line in face_lines:
+        face = face_line.split()
+        all_faces.append(np.array(face[: int(face[0]) + 1], dtype=int))
     return off_vertices, all_faces
 
 
+def _parse_uniform_off_faces(face_lines):
+    """
+    Meshes usually have the same number of vertices in every face, their face lines are read in one go
+
+    :param face_lines: Face definition lines from an OFF file
+    :return: 2D array with a row for each face, or None if the faces do not all have the same number of vertices
+    """
+    if not face_lines:
+        return None
+    try:
+        # Colour values may be floating point
+        face_rows = np.loadtxt(face_lines, dtype=float, ndmin=2)
+    except ValueError:
+        return None
+    vertices_in_face = face_rows[0, 0]
+    if not np.all(face_rows[:, 0] == vertices_in_face):
+        return None
+    return face_rows[:, : int(vertices_in_face) + 1].astype(int)
+
+
 def write_off_file(filename, vertices, faces, winding_order):
     """
     Create an OFF format file
@@ -104,15 +126,36 @@ def create_off_face_vertex_map(off_faces):
     :param off_faces: OFF-style faces array, each row is number of vertices followed by vertex indices
     :return: flattened array (winding_order) and the start indices in that (faces)
     """
-    faces = []
-    winding_order = []
-    current_index = 0
-    for face in off_faces:
-        faces.append(current_index)
-        current_index += face[0]
-        for vertex_index in face[1:]:
-            winding_order.append(vertex_index)
-    return np.array(winding_order), np.array(faces)
+    if len(off_faces) == 0:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    if isinstance(off_faces, np.ndarray) and off_faces.ndim == 2:
+        # Every face has the same number of vertices
+        vertices_in_faces = off_faces[:, 0]
+        winding_order = off_faces[:, 1:].ravel()
+    else:
+        vertices_in_faces = np.array([face[0] for face in off_faces], dtype=int)
+        winding_order = np.concatenate([face[1:] for face in off_faces])
+    faces = np.concatenate(([0], np.cumsum(vertices_in_faces)[:-1]))
+    return winding_order, faces
+
+
+@lru_cache(maxsize=64)
+def _get_rotation_from_x_axis(axis):
+    """
+    Tubes are constructed along the x axis and then rotated, the tubes in a detector usually share their axis
+    so the rotation matrix is only calculated once for each axis
+
+    :param axis: Axis of the tube as a tuple
+    :return: Read-only 3D rotation matrix, or None if there is no unique rotation
+    """
+    try:
+        rotation_matrix = find_rotation_matrix_between_vectors(
+            np.array(axis), np.array([1.0, 0.0, 0.0])
+        )
+    except Exception:
+        return None
+    rotation_matrix.setflags(write=False)
+    return rotation_matrix
 
 
 def construct_cylinder_mesh(height, radius, axis, centre=None, number_of_vertices=50):
@@ -130,26 +173,20 @@ def construct_cylinder_mesh(height, radius, axis, centre=None, number_of_vertice
     if centre is None:
         centre = [0, 0, 0]
     face_centre = [centre[0] - (height / 2.0), centre[1], centre[2]]
-    angles = np.linspace(0, 2 * np.pi, int((number_of_vertices / 2) + 1))
-    # The last point is the same as the first so get rid of it
-    angles = angles[:-1]
+    # Half of the vertices are at each end of the tube, the end point would be the same as the first point
+    angles = np.linspace(0, 2 * np.pi, int(number_of_vertices) // 2, endpoint=False)
     y = face_centre[1] + radius * np.cos(angles)
     z = face_centre[2] + radius * np.sin(angles)
     num_points_at_each_tube_end = len(y)
     vertices = np.concatenate(
         (
-            np.array(list(zip(np.zeros(len(y)) + face_centre[0], y, z))),
-            np.array(list(zip(np.ones(len(y)) * height + face_centre[0], y, z))),
+            np.column_stack((np.full_like(y, face_centre[0]), y, z)),
+            np.column_stack((np.full_like(y, height + face_centre[0]), y, z)),
         )
     )
 
     # Rotate vertices to correct the tube axis
-    try:
-        rotation_matrix = find_rotation_matrix_between_vectors(
-            np.array(axis), np.array([1.0, 0.0, 0.0])
-        )
-    except Exception:
-        rotation_matrix = None
+    rotation_matrix = _get_rotation_from_x_axis(tuple(np.asarray(axis, dtype=float)))
     if rotation_matrix is not None:
         vertices = rotation_matrix.dot(vertices.T).T
 
@@ -165,26 +202,17 @@ def construct_cylinder_mesh(height, radius, axis, centre=None, number_of_vertice
     #  circular boundary v                     v
     #
     # face starts with the number of vertices in the face (4)
-    faces = [
-        [
-            4,
+    nth_vertex = np.arange(num_points_at_each_tube_end)
+    # The last rectangular face joins back to the first vertices
+    next_vertex = (nth_vertex + 1) % num_points_at_each_tube_end
+    faces = np.column_stack(
+        (
+            np.full_like(nth_vertex, 4),
             nth_vertex,
             nth_vertex + num_points_at_each_tube_end,
-            nth_vertex + num_points_at_each_tube_end + 1,
-            nth_vertex + 1,
-        ]
-        for nth_vertex in range(num_points_at_each_tube_end - 1)
-    ]
-    # Append the last rectangular face
-    faces.append(
-        [
-            4,
-            num_points_at_each_tube_end - 1,
-            (2 * num_points_at_each_tube_end) - 1,
-            num_points_at_each_tube_end,
-            0,
-        ]
+            next_vertex + num_points_at_each_tube_end,
+            next_vertex,
+        )
     )
     # NB this is a tube, not a cylinder; I'm not adding the circular faces on the ends of the tube
-    faces = np.array(faces)
     return vertices, faces
@@ -1,5 +1,8 @@
+import h5py
 import numpy as np
 import logging
+from functools import lru_cache
+from itertools import product
 
 """
 Free-function utilities for use by the NexusBuilder
@@ -158,6 +161,133 @@ def get_an_orthogonal_unit_vector(input_vector):
     return unit_vector
 
 
+def calculate_chunk_shape(shape, itemsize, target_bytes=262144):
+    """
+    Calculate a chunk shape of at most roughly target_bytes by splitting the dataset along its first dimension
+
+    :param shape: Shape of the dataset
+    :param itemsize: Size of each element in bytes
+    :param target_bytes: Approximate maximum size of a chunk in bytes
+    :return: Chunk shape as a tuple, or None if the dataset is empty as there is no valid chunk shape
+    """
+    if 0 in shape:
+        return None
+    chunk_shape = list(shape)
+    slice_bytes = itemsize * int(np.prod(chunk_shape[1:]))
+    chunk_shape[0] = min(chunk_shape[0], max(1, target_bytes // slice_bytes))
+    return tuple(chunk_shape)
+
+
+def iter_blocks(shape, block_shape):
+    """
+    Split an array into blocks, the blocks at the upper edges are cut short to fit in the array
+
+    :param shape: Shape of the array
+    :param block_shape: Shape of each block
+    :return: Generator of tuples of slices, one for each block
+    """
+    block_starts = [
+        range(0, dimension, block) for dimension, block in zip(shape, block_shape)
+    ]
+    for starts in product(*block_starts):
+        yield tuple(
+            slice(start, min(start + block, dimension))
+            for start, block, dimension in zip(starts, block_shape, shape)
+        )
+
+
+def is_shuffled_type(dtype):
+    """
+    Byte shuffling groups the bytes of each element by significance, it only helps compress numbers of more
+    than one byte
+
+    :param dtype: numpy dtype of the data
+    :return: True if the byte shuffle filter should be used for data of this type
+    """
+    return dtype.kind in "iuf" and dtype.itemsize > 1
+
+
+@lru_cache(maxsize=256)
+def encode_string(value):
+    """
+    Encode a string as a fixed-length byte string, the same few strings such as units are written many times
+
+    :param value: String to encode
+    :return: numpy bytes scalar, which h5py writes as a fixed-length string
+    """
+    return np.bytes_(value)
+
+
+@lru_cache(maxsize=None)
+def _get_hdf5_type(dtype):
+    return h5py.h5t.py_create(dtype)
+
+
+_SCALAR_SPACE = h5py.h5s.create(h5py.h5s.SCALAR)
+# Link creation properties h5py uses for names given to create_dataset
+_LINK_CREATE_PLIST = h5py.h5p.create(h5py.h5p.LINK_CREATE)
+_LINK_CREATE_PLIST.set_create_intermediate_group(True)
+_LINK_CREATE_PLIST.set_char_encoding(h5py.h5t.CSET_UTF8)
+# Dataset creation properties, as with h5py's create_dataset the object timestamps are not recorded so that
+# output files are reproducible
+_DATASET_CREATE_PLIST = h5py.h5p.create(h5py.h5p.DATASET_CREATE)
+_DATASET_CREATE_PLIST.set_obj_track_times(False)
+
+
+def create_string_attribute(h5_object, name, value):
+    """
+    Create a scalar fixed-length string attribute with the low-level h5py API, the attribute must not already exist
+
+    :param h5_object: Group or dataset to add the attribute to
+    :param name: Name of the attribute
+    :param value: String value of the attribute
+    """
+    encoded_value = np.asarray(encode_string(value))
+    attribute_id = h5py.h5a.create(
+        h5_object.id, name.encode(), _get_hdf5_type(encoded_value.dtype), _SCALAR_SPACE
+    )
+    attribute_id.write(encoded_value)
+
+
+def create_numeric_attribute(h5_object, name, value):
+    """
+    Create a numeric attribute with the low-level h5py API, the attribute must not already exist
+
+    :param h5_object: Group or dataset to add the attribute to
+    :param name: Name of the attribute
+    :param value: Numeric numpy array or scalar
+    """
+    value = np.require(value, requirements="C")
+    space = h5py.h5s.create_simple(value.shape) if value.ndim else _SCALAR_SPACE
+    attribute_id = h5py.h5a.create(
+        h5_object.id, name.encode(), _get_hdf5_type(value.dtype), space
+    )
+    attribute_id.write(value)
+
+
+def create_string_dataset(group, name, value):
+    """
+    Create a scalar fixed-length string dataset with the low-level h5py API, the dataset must not already exist
+    and intermediate groups in its name are created
+
+    :param group: Group to add the dataset to
+    :param name: Name of the dataset
+    :param value: String value of the dataset
+    :return: Dataset
+    """
+    encoded_value = np.asarray(encode_string(value))
+    dataset_id = h5py.h5d.create(
+        group.id,
+        name.encode(),
+        _get_hdf5_type(encoded_value.dtype),
+        _SCALAR_SPACE,
+        dcpl=_DATASET_CREATE_PLIST,
+        lcpl=_LINK_CREATE_PLIST,
+    )
+    dataset_id.write(h5py.h5s.ALL, h5py.h5s.ALL, encoded_value)
+    return h5py.Dataset(dataset_id)
+
+
 def create_dataset(
     nexus_entry,
     group,
@@ -166,6 +296,8 @@ def create_dataset(
     attributes=None,
     compress_type=None,
     compress_opts=None,
+    chunks=None,
+    shuffle=False,
 ):
     """
     Add a dataset to a given group
@@ -174,6 +306,8 @@ def create_dataset(
     :param name: Name of the dataset to create
     :param data: Data to put in the dataset
     :param attributes: Optional dictionary of attributes to add to dataset
+    :param chunks: Optional chunk shape, otherwise h5py chooses one if chunking is needed
+    :param shuffle: Use the HDF5 byte shuffle filter for numeric data with elements of more than one byte
     :return: Dataset
     """
     if isinstance(group, str):
@@ -186,25 +320,32 @@ def create_dataset(
         )
 
     if isinstance(data, str):
-        dataset = group.create_dataset(
-            name, data=np.array(data).astype("|S" + str(len(data)))
-        )
+        dataset = create_string_dataset(group, name, data)
     elif is_scalar(data):
         # Don't try to use compression with scalar datasets
         dataset = group.create_dataset(name, data=data)
     else:
+        array_data = np.asarray(data)
+        # h5py writes lists of Python strings as variable-length strings, but cannot write numpy unicode arrays
+        if array_data.dtype.kind not in "UO":
+            data = array_data
         dataset = group.create_dataset(
-            name, data=data, compression=compress_type, compression_opts=compress_opts
+            name,
+            data=data,
+            compression=compress_type,
+            compression_opts=compress_opts,
+            chunks=chunks,
+            shuffle=shuffle and is_shuffled_type(array_data.dtype),
         )
 
     if attributes:
-        for key in attributes:
-            if isinstance(attributes[key], str):
-                # Since python 3 we have to treat strings like this
-                dataset.attrs.create(
-                    key,
-                    np.array(attributes[key]).astype("|S" + str(len(attributes[key]))),
-                )
+        for key, value in attributes.items():
+            if isinstance(value, str):
+                create_string_attribute(dataset, key, value)
+                continue
+            value = np.asarray(value)
+            if value.dtype.kind in "biuf" and value.size:
+                create_numeric_attribute(dataset, key, value)
             else:
-                dataset.attrs.create(key, np.array(attributes[key]))
+                dataset.attrs.create(key, value)
     return dataset
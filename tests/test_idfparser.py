@@ -142,6 +142,17 @@ def test_get_structured_detector_vertices_returns_coords_specified_in_IDF():
     fake_idf_file.close()
 
 
+def test_get_structured_detector_vertices_are_only_parsed_once_for_each_type():
+    vertices = np.zeros((4, 3))
+    detector = {"name": "TEST_STRUCT_DET", "type": "fan", "vertices": vertices}
+    fake_idf_file = create_fake_idf_file(structured_detector=detector)
+    parser = IDFParser(fake_idf_file)
+    first_vertices = parser.get_structured_detector_vertices(detector["type"])
+    assert parser.get_structured_detector_vertices(detector["type"]) is first_vertices
+    assert not first_vertices.flags.writeable
+    fake_idf_file.close()
+
+
 def test_get_detectors_throws_when_pixel_shape_is_unknown():
     pixel = {"shape": {"shape": "lumpy"}, "name": "potato"}
     detector = {"pixel": pixel}
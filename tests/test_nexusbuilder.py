@@ -1,4 +1,8 @@
+import h5py
+import numpy as np
+import pytest
 from nexusutils.nexusbuilder import NexusBuilder
+from tests.idfhelper import create_fake_idf_file
 
 
 def test_add_instrument_results_in_instrument_in_file_with_specified_name():
@@ -18,3 +22,337 @@ def test_add_source_results_in_source_in_file_with_specified_name():
     root = builder.get_root()
     source_group = root["instrument/source"]
     assert source_group["name"][...].astype(str) == source_name
+
+
+def test_output_file_can_be_created_readable_by_older_hdf5_versions():
+    builder = NexusBuilder(
+        "test_output_file.hdf5", file_in_memory=True, libver="earliest"
+    )
+    assert builder.target_file.libver[0] == "earliest"
+
+
+def test_builder_can_be_closed_more_than_once():
+    builder = NexusBuilder("test_output_file.hdf5", file_in_memory=True)
+    builder.close()
+    assert builder.target_file is None
+    builder.close()
+
+
+def _create_source_file(path, compression=None):
+    with h5py.File(path, "w") as source_file:
+        dataset = source_file.create_dataset(
+            "entry/data/counts", data=np.arange(100), compression=compression
+        )
+        dataset.attrs.create("units", np.bytes_("counts"))
+        dataset.attrs.create("target", np.bytes_("/entry/data/counts"))
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_copy_items_copies_dataset_values_and_attributes_except_target(
+    tmp_path, compression
+):
+    source_filename = str(tmp_path / "source.hdf5")
+    _create_source_file(source_filename, compression)
+    builder = NexusBuilder(
+        "test_output_file.hdf5",
+        input_nexus_filename=source_filename,
+        file_in_memory=True,
+    )
+    builder.copy_items({"entry/data/counts": "raw_data_1/counts"})
+    copied_dataset = builder.get_root()["counts"]
+    assert np.array_equal(copied_dataset[...], np.arange(100))
+    assert copied_dataset.attrs["units"] == b"counts"
+    assert "target" not in copied_dataset.attrs
+
+
+def test_copy_items_releases_source_datasets_after_copying(tmp_path):
+    source_filename = str(tmp_path / "source.hdf5")
+    _create_source_file(source_filename, compression="lzf")
+    with NexusBuilder(
+        "test_released_output_file.hdf5",
+        input_nexus_filename=source_filename,
+        compress_type="gzip",
+        file_in_memory=True,
+    ) as builder:
+        builder.copy_items({"entry/data/counts": "raw_data_1/counts"})
+        open_datasets = h5py.h5f.get_obj_count(
+            builder.source_file.id, h5py.h5f.OBJ_DATASET
+        )
+        assert open_datasets == 0
+
+
+def test_source_file_is_not_reopened_after_close(tmp_path):
+    source_filename = str(tmp_path / "source.hdf5")
+    _create_source_file(source_filename)
+    builder = NexusBuilder(
+        "test_closed_output_file.hdf5",
+        input_nexus_filename=source_filename,
+        file_in_memory=True,
+    )
+    builder.copy_items({"entry/data/counts": "raw_data_1/counts"})
+    builder.close()
+    assert builder.source_file is None
+
+
+def test_copy_items_recompresses_dataset_with_different_compression_level(tmp_path):
+    source_filename = str(tmp_path / "source.hdf5")
+    _create_source_file(source_filename, compression="gzip")
+    builder = NexusBuilder(
+        "test_output_file.hdf5",
+        input_nexus_filename=source_filename,
+        compress_type="gzip",
+        compress_opts=1,
+        file_in_memory=True,
+    )
+    builder.copy_items({"entry/data/counts": "raw_data_1/counts"})
+    copied_dataset = builder.get_root()["counts"]
+    assert np.array_equal(copied_dataset[...], np.arange(100))
+    assert copied_dataset.compression_opts == 1
+
+
+def test_numeric_datasets_are_byte_shuffled_when_compressed_with_gzip():
+    builder = NexusBuilder(
+        "test_output_file.hdf5", compress_type="gzip", file_in_memory=True
+    )
+    numeric_dataset = builder.add_dataset(builder.root, "numbers", np.arange(100000.0))
+    bytes_dataset = builder.add_dataset(
+        builder.root, "bytes", np.zeros(100000, dtype=np.uint8)
+    )
+    assert numeric_dataset.shuffle
+    assert not bytes_dataset.shuffle
+
+
+def test_compressed_multidimensional_dataset_is_chunked_in_whole_rows():
+    builder = NexusBuilder(
+        "test_output_file.hdf5", compress_type="gzip", file_in_memory=True
+    )
+    dataset = builder.add_dataset(builder.root, "grid", np.zeros((1000, 300)))
+    assert dataset.chunks == (436, 300)
+
+
+def test_compressed_1d_arrays_are_chunked_to_about_one_mebibyte():
+    builder = NexusBuilder(
+        "test_output_file.hdf5", compress_type="gzip", file_in_memory=True
+    )
+    dataset = builder.add_dataset(builder.root, "event_id", np.zeros(1000000))
+    assert dataset.chunks == (131072,)
+
+
+def test_small_arrays_are_not_compressed():
+    builder = NexusBuilder(
+        "test_output_file.hdf5", compress_type="gzip", file_in_memory=True
+    )
+    dataset = builder.add_dataset(builder.root, "vertices", np.zeros((8, 3)))
+    assert dataset.compression is None
+    assert dataset.chunks is None
+
+
+def test_small_and_empty_pixel_offsets_are_not_chunked():
+    builder = NexusBuilder(
+        "test_output_file.hdf5", compress_type="gzip", file_in_memory=True
+    )
+    builder.add_instrument("TEST")
+    offsets = {"x_pixel_offset": np.zeros(100), "y_pixel_offset": np.zeros(0)}
+    detector = builder.add_detector("detector", 1, np.arange(100), offsets)
+    for offset_name in offsets:
+        assert detector[offset_name].chunks is None
+        assert detector[offset_name].compression is None
+
+
+@pytest.mark.parametrize("compress_type", [None, "gzip"])
+def test_list_of_strings_is_written_as_string_dataset(compress_type):
+    builder = NexusBuilder(
+        "test_output_file.hdf5", compress_type=compress_type, file_in_memory=True
+    )
+    dataset = builder.add_dataset(builder.root, "names", ["ab", "c"])
+    assert [name.decode() for name in dataset[...]] == ["ab", "c"]
+
+
+def test_blosc_compression_preset_raises_if_filter_is_not_available(monkeypatch):
+    monkeypatch.setattr(h5py.h5z, "filter_avail", lambda filter_id: False)
+    with pytest.raises(ValueError, match="install hdf5plugin to use it"):
+        NexusBuilder(
+            "test_output_file.hdf5", compress_type="blosc_lz4", file_in_memory=True
+        )
+
+
+def test_copy_items_copies_group_attributes_without_its_members(tmp_path):
+    source_filename = str(tmp_path / "source.hdf5")
+    _create_source_file(source_filename)
+    with h5py.File(source_filename, "r+") as source_file:
+        source_file["entry/data"].attrs.create("NX_class", np.bytes_("NXdata"))
+    builder = NexusBuilder(
+        "test_output_file.hdf5",
+        input_nexus_filename=source_filename,
+        file_in_memory=True,
+    )
+    builder.copy_items({"/entry/data": "raw_data_1/data"})
+    copied_group = builder.get_root()["data"]
+    assert copied_group.attrs["NX_class"] == b"NXdata"
+    assert len(copied_group) == 0
+
+
+def test_copy_items_copies_groups_before_their_members_whatever_the_map_order(
+    tmp_path,
+):
+    source_filename = str(tmp_path / "source.hdf5")
+    _create_source_file(source_filename)
+    builder = NexusBuilder(
+        "test_output_file.hdf5",
+        input_nexus_filename=source_filename,
+        file_in_memory=True,
+    )
+    builder.copy_items(
+        {
+            "entry/data/counts": "raw_data_1/data/counts",
+            "entry/data": "raw_data_1/data",
+        }
+    )
+    copied_dataset = builder.get_root()["data/counts"]
+    assert np.array_equal(copied_dataset[...], np.arange(100))
+
+
+@pytest.mark.parametrize("compress_type", [None, "gzip"])
+def test_copy_tree_copies_group_with_all_members(tmp_path, compress_type):
+    source_filename = str(tmp_path / "source.hdf5")
+    _create_source_file(source_filename)
+    builder = NexusBuilder(
+        "test_output_file.hdf5",
+        input_nexus_filename=source_filename,
+        compress_type=compress_type,
+        file_in_memory=True,
+    )
+    builder.copy_tree("entry", "raw_data_1/entry")
+    copied_dataset = builder.get_root()["entry/data/counts"]
+    assert np.array_equal(copied_dataset[...], np.arange(100))
+    assert copied_dataset.compression == compress_type
+    assert copied_dataset.attrs["units"] == b"counts"
+    assert "target" not in copied_dataset.attrs
+
+
+@pytest.mark.parametrize("compress_type", [None, "gzip"])
+def test_copy_tree_copies_scalar_datasets(tmp_path, compress_type):
+    source_filename = str(tmp_path / "source.hdf5")
+    _create_source_file(source_filename)
+    with h5py.File(source_filename, "r+") as source_file:
+        run_number = source_file.create_dataset("entry/run_number", data=42)
+        run_number.attrs.create("target", np.bytes_("/entry/run_number"))
+    builder = NexusBuilder(
+        "test_output_file.hdf5",
+        input_nexus_filename=source_filename,
+        compress_type=compress_type,
+        file_in_memory=True,
+    )
+    builder.copy_tree("entry", "raw_data_1/entry")
+    copied_run_number = builder.get_root()["entry/run_number"]
+    assert copied_run_number[()] == 42
+    assert "target" not in copied_run_number.attrs
+
+
+def test_add_detectors_from_idf_writes_pixel_offsets_ids_and_shape():
+    pixel = {
+        "name": "pixel",
+        "shape": {
+            "shape": "cylinder",
+            "axis": np.array([0.0, 1.0, 0.0]),
+            "height": 0.2,
+            "radius": 0.1,
+        },
+    }
+    builder = NexusBuilder(
+        "test_output_file.hdf5",
+        idf_file=create_fake_idf_file(detector={"pixel": pixel}),
+        file_in_memory=True,
+    )
+    builder.add_instrument("TEST")
+    assert builder.add_detectors_from_idf() == 1
+    detector_group = builder.get_root()["instrument/detector_1"]
+    assert np.allclose(detector_group["x_pixel_offset"][...], [0.0, 0.0, 0.0])
+    assert np.allclose(detector_group["y_pixel_offset"][...], [-0.1, 0.0, 0.1])
+    # z offsets are all zero so are not written
+    assert "z_pixel_offset" not in detector_group
+    assert np.array_equal(detector_group["detector_number"][...], [1, 2, 3])
+    assert "pixel_shape" in detector_group
+
+
+def test_add_structured_detectors_from_idf_writes_pixel_offsets_and_faces():
+    x_pos = np.hstack(
+        (
+            np.linspace(-3.0, 3.0, 4),
+            np.linspace(-1.5, 1.5, 4),
+            np.linspace(-0.3, 0.3, 4),
+        )
+    )
+    y_pos = np.hstack(np.array([[1.0] * 4, [0.0] * 4, [-1.0] * 4]))
+    z_pos = np.array([0.0] * 12)
+    vertices = np.column_stack((x_pos, y_pos, z_pos))
+    builder = NexusBuilder(
+        "test_output_file.hdf5",
+        idf_file=create_fake_idf_file(
+            structured_detector={
+                "name": "TEST_STRUCT_DET",
+                "type": "fan",
+                "vertices": vertices,
+            }
+        ),
+        file_in_memory=True,
+    )
+    builder.add_instrument("TEST")
+    assert builder.add_structured_detectors_from_idf() == 1
+    detector_group = builder.get_root()["instrument/detector_1"]
+    assert np.array_equal(
+        detector_group["detector_number"][...], [[0, 2, 4], [1, 3, 5]]
+    )
+    assert np.allclose(
+        detector_group["x_pixel_offset"][...], [[-1.5, 0.0, 1.5], [-0.6, 0.0, 0.6]]
+    )
+    assert np.allclose(
+        detector_group["y_pixel_offset"][...], [[0.5, 0.5, 0.5], [-0.5, -0.5, -0.5]]
+    )
+    assert "z_pixel_offset" not in detector_group
+    shape_group = detector_group["detector_shape"]
+    assert np.array_equal(shape_group["faces"][...], np.arange(0, 24, 4))
+    assert np.array_equal(
+        shape_group["winding_order"][...],
+        [0, 4, 5, 1, 1, 5, 6, 2, 2, 6, 7, 3, 4, 8, 9, 5, 5, 9, 10, 6, 6, 10, 11, 7],
+    )
+    assert np.array_equal(
+        shape_group["detector_faces"][...],
+        [[0, 0], [1, 2], [2, 4], [3, 1], [4, 3], [5, 5]],
+    )
+
+
+def test_source_at_the_origin_has_a_zero_translation_along_a_unit_vector():
+    builder = NexusBuilder("test_output_file.hdf5", file_in_memory=True)
+    builder.add_instrument("TEST")
+    builder.add_source("TEST_SOURCE", position=[0.0, 0.0, 0.0])
+    location = builder.get_root()["instrument/source/transformations/location"]
+    assert location[()] == 0.0
+    assert np.allclose(location.attrs["vector"], [0.0, 0.0, 1.0])
+
+
+def test_transformation_vector_is_written_in_single_precision():
+    builder = NexusBuilder("test_output_file.hdf5", file_in_memory=True)
+    transforms = builder.add_nx_group(
+        builder.get_root(), "transformations", "NXtransformations"
+    )
+    translation = builder.add_transformation(
+        transforms, "translation", 2.5, "m", [0.0, 1.0, 0.0]
+    )
+    assert translation.attrs["vector"].dtype == np.float32
+    assert translation.dtype == np.float64
+
+
+def test_adding_a_monitor_without_an_instrument_raises_runtime_error():
+    builder = NexusBuilder("test_output_file.hdf5", file_in_memory=True)
+    with pytest.raises(RuntimeError):
+        builder.add_monitor("monitor_1", 1, [0.0, 0.0, 1.0], "m")
+
+
+def test_unknown_transformation_type_raises_value_error():
+    builder = NexusBuilder("test_output_file.hdf5", file_in_memory=True)
+    transforms = builder.add_nx_group(
+        builder.get_root(), "transformations", "NXtransformations"
+    )
+    with pytest.raises(ValueError):
+        builder.add_transformation(transforms, "shear", 1.0, "m", [0.0, 0.0, 1.0])
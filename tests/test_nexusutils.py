@@ -1,3 +1,4 @@
+import h5py
 import pytest
 import numpy as np
 from nexusutils.utils import (
@@ -8,6 +9,12 @@ from nexusutils.utils import (
     get_an_orthogonal_unit_vector,
     find_rotation_axis_and_angle_between_vectors,
     rotation_matrix_from_axis_and_angle,
+    calculate_chunk_shape,
+    iter_blocks,
+    create_string_attribute,
+    create_numeric_attribute,
+    create_string_dataset,
+    create_dataset,
 )
 
 
@@ -125,3 +132,58 @@ def test_rotation_matrix_from_axis_and_angle():
     assert np.allclose(
         rotation_matrix, np.array([[0.0, 1.0, 0.0], [-1.0, 0.0, 0.0], [0.0, 0.0, 1.0]])
     )
+
+
+def test_calculate_chunk_shape_is_whole_dataset_when_smaller_than_target():
+    assert calculate_chunk_shape((1000,), 8, target_bytes=262144) == (1000,)
+
+
+def test_calculate_chunk_shape_is_none_for_empty_dataset():
+    assert calculate_chunk_shape((0, 3), 8) is None
+
+
+def test_calculate_chunk_shape_splits_first_dimension_to_fit_target():
+    assert calculate_chunk_shape((100000, 3), 8, target_bytes=240) == (10, 3)
+
+
+def test_iter_blocks_covers_array_including_partial_blocks_at_edges():
+    array = np.arange(35).reshape((5, 7))
+    copied = np.zeros_like(array)
+    blocks = list(iter_blocks(array.shape, (2, 3)))
+    for block in blocks:
+        copied[block] = array[block]
+    assert len(blocks) == 9
+    assert np.array_equal(copied, array)
+
+
+def test_string_attribute_is_written_as_fixed_length_bytes():
+    with h5py.File("test_file.hdf5", "w", driver="core", backing_store=False) as file:
+        create_string_attribute(file, "units", "m")
+        assert file.attrs["units"] == b"m"
+        assert file.attrs.get_id("units").get_type().get_size() == 1
+
+
+def test_numeric_attribute_keeps_its_shape_and_type():
+    with h5py.File("test_file_2.hdf5", "w", driver="core", backing_store=False) as file:
+        create_numeric_attribute(file, "vector", np.array([0.0, 0.0, 1.0], np.float32))
+        create_numeric_attribute(file, "count", 3)
+        assert np.array_equal(file.attrs["vector"], [0.0, 0.0, 1.0])
+        assert file.attrs["vector"].dtype == np.float32
+        assert file.attrs["count"].shape == ()
+        assert file.attrs["count"] == 3
+
+
+def test_string_dataset_does_not_record_object_timestamps():
+    with h5py.File("test_file_3.hdf5", "w", driver="core", backing_store=False) as file:
+        dataset = create_string_dataset(file, "depends_on", ".")
+        assert dataset[()] == b"."
+        assert not dataset.id.get_create_plist().get_obj_track_times()
+
+
+@pytest.mark.parametrize("compress_type", [None, "gzip"])
+def test_create_dataset_writes_list_of_strings(compress_type):
+    with h5py.File("test_file_4.hdf5", "w", driver="core", backing_store=False) as file:
+        dataset = create_dataset(
+            file, file, "names", ["ab", "c"], compress_type=compress_type
+        )
+        assert [name.decode() for name in dataset[...]] == ["ab", "c"]
@@ -1,5 +1,10 @@
 from io import StringIO
-from nexusutils.readwriteoff import parse_off_file
+import numpy as np
+from nexusutils.readwriteoff import (
+    parse_off_file,
+    construct_cylinder_mesh,
+    create_off_face_vertex_map,
+)
 
 test_OFF_file = StringIO(
     "OFF\n"
@@ -46,3 +51,48 @@ def test_outputs_contain_number_of_vertices_and_faces_specified_in_file_header()
     vertices, faces = parse_off_file(test_OFF_file)
     assert len(vertices) == 8
     assert len(faces) == 6
+
+
+def test_cylinder_mesh_faces_join_the_vertices_at_each_end_of_the_tube():
+    vertices, faces = construct_cylinder_mesh(2.0, 0.5, [1.0, 0.0, 0.0], None, 8)
+    assert vertices.shape == (8, 3)
+    assert np.allclose(vertices[:4, 0], -1.0)
+    assert np.allclose(vertices[4:, 0], 1.0)
+    assert np.array_equal(
+        faces,
+        [[4, 0, 4, 5, 1], [4, 1, 5, 6, 2], [4, 2, 6, 7, 3], [4, 3, 7, 4, 0]],
+    )
+
+
+def test_face_vertex_map_flattens_faces_with_different_numbers_of_vertices():
+    off_faces = [
+        np.array([3, 0, 1, 2]),
+        np.array([4, 2, 1, 3, 4]),
+        np.array([3, 4, 3, 5]),
+    ]
+    winding_order, faces = create_off_face_vertex_map(off_faces)
+    assert np.array_equal(winding_order, [0, 1, 2, 2, 1, 3, 4, 4, 3, 5])
+    assert np.array_equal(faces, [0, 3, 7])
+
+
+def test_faces_with_different_numbers_of_vertices_are_parsed_without_colours():
+    off_file = StringIO(
+        "OFF\n"
+        "5 2 0\n"
+        "0.0 0.0 0.0\n"
+        "1.0 0.0 0.0\n"
+        "1.0 1.0 0.0\n"
+        "0.0 1.0 0.0\n"
+        "0.5 0.5 1.0\n"
+        "4 0 1 2 3\n"
+        "3 0 1 4 0.5 0.5 0.5\n"
+    )
+    vertices, faces = parse_off_file(off_file)
+    assert np.array_equal(faces[0], [4, 0, 1, 2, 3])
+    assert np.array_equal(faces[1], [3, 0, 1, 4])
+
+
+def test_face_vertex_map_of_no_faces_is_empty():
+    winding_order, faces = create_off_face_vertex_map([])
+    assert winding_order.size == 0
+    assert faces.size == 0